@@ -1,13 +1,31 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pacsv
 import os
+import time
 from datetime import datetime
-from warehouse_management import SKUMapper, process_sales_data, fetch_baserow_stock_levels
+from warehouse_management import (
+    SKUMapper, process_sales_data, read_sales_csv, fetch_baserow_stock_levels, BASEROW_FIELD_MAP, EXCEL_ENGINE,
+    BASEROW_PAGE_SIZE, BASEROW_TIMEOUT
+)
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import InvalidHeader
 from dotenv import load_dotenv
 import logging
+import logging.handlers
 import io
+import json
+import orjson
+import hashlib
+import functools
+from types import SimpleNamespace
 from collections import deque
+from itertools import islice
+from urllib.parse import quote_plus
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 skipcounter = 0
 # Custom logging handler to capture logs in memory
@@ -17,6 +35,7 @@ class StreamlitLogHandler(logging.Handler):
         self.log_buffer = deque(maxlen=max_logs)
         
     def emit(self, record):
+        # Keep only the formatted text, so buffered entries don't hold on to args or tracebacks
         log_entry = self.format(record)
         self.log_buffer.append(log_entry)
         
@@ -26,74 +45,243 @@ class StreamlitLogHandler(logging.Handler):
     def clear_logs(self):
         self.log_buffer.clear()
 
-# Initialize the custom log handler
-st_log_handler = StreamlitLogHandler()
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('warehouse_management.log'),
-        logging.StreamHandler(),
-        st_log_handler  # Add our custom handler
-    ]
-)
-logger = logging.getLogger(__name__)
+@st.cache_resource(show_spinner=False)
+def configure_logging():
+    """Attach the log handlers to the root logger once per process, not on every rerun."""
+    file_handler = logging.FileHandler('warehouse_management.log')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    st_log_handler = StreamlitLogHandler()
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT,
+        handlers=[
+            # Buffer file writes; flushed every 1000 records, on errors, and before the log window is read
+            logging.handlers.MemoryHandler(capacity=1000, flushLevel=logging.ERROR, target=file_handler),
+            st_log_handler  # Add our custom handler
+        ]
+    )
+    return st_log_handler
 
-# Load environment variables
-load_dotenv()
+# Initialize the custom log handler
+st_log_handler = configure_logging()
+logger = logging.getLogger(__name__)
 
 # Baserow configuration
-BASEROW_TOKEN = os.getenv('BASEROW_API_TOKEN')
 BASEROW_URL = "https://api.baserow.io"
 TABLE_ID = "577266"
+# Baserow accepts at most 200 rows per batch request
+BASEROW_BATCH_SIZE = 200
+# Most SKUs matched per duplicate-check request
+BASEROW_FILTER_BATCH_SIZE = 100
+# Longest URL-encoded filters parameter per duplicate-check request. The filters travel in
+# the query string, and proxies commonly reject request lines over 4-8 KB (gunicorn: 4094
+# bytes), so this leaves room for the path and the other parameters under 4 KB
+BASEROW_FILTER_MAX_QUERY_LENGTH = 3000
+# Numeric Baserow field ID of the SKU column, as used in filter queries
+BASEROW_SKU_FIELD_ID = int(BASEROW_FIELD_MAP['SKU'].removeprefix('field_'))
+# Number of batch requests sent to Baserow concurrently
+BASEROW_MAX_WORKERS = 8
+
+# Rows shown in upload previews
+PREVIEW_ROWS = 5
+
+# Retries and exponential backoff factor (seconds) for Baserow requests
+BASEROW_RETRIES = 5
+BASEROW_BACKOFF_FACTOR = 0.5
+# Statuses for which Baserow did not process a request, so a batch create can be resent safely
+BASEROW_POST_RETRY_STATUSES = (429, 503)
+
+# Shared HTTP session so Baserow calls reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    # Retry throttling and gateway errors with exponential backoff, honouring Retry-After.
+    # Only reads are retried here: a batch create that errored or timed out may already have
+    # stored its rows, so post_batch_to_baserow retries just the statuses it knows were rejected.
+    max_retries=Retry(
+        total=BASEROW_RETRIES,
+        backoff_factor=BASEROW_BACKOFF_FACTOR,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True
+    )
+))
+
+@functools.lru_cache(maxsize=1)
+def get_baserow_config():
+    """Load environment variables once and return the Baserow token and request headers."""
+    load_dotenv()
+    token = os.getenv('BASEROW_API_TOKEN')
+    headers = {
+        'Authorization': f'Token {token}',
+        'Content-Type': 'application/json'
+    }
+    # Attach the credentials to the shared session once, so individual calls don't pass them
+    SESSION.headers.update(headers)
+    return SimpleNamespace(token=token, headers=headers)
 
-def load_excel_data(file_path):
-    """Load data from Excel file."""
+@st.cache_data(show_spinner=False)
+def load_excel_data(file_bytes):
+    """Load the first rows of the Excel file contents for preview."""
     try:
-        return pd.read_excel(file_path)
+        return pd.read_excel(io.BytesIO(file_bytes), nrows=PREVIEW_ROWS, engine=EXCEL_ENGINE)
     except Exception as e:
         st.error(f"Error loading Excel file: {str(e)}")
         return None
 
-def load_csv_data(file_path):
-    """Load data from CSV file."""
+@st.cache_data(show_spinner=False)
+def load_csv_data(file_bytes):
+    """Load data from CSV file contents."""
     try:
-        return pd.read_csv(file_path)
+        return read_sales_csv(io.BytesIO(file_bytes))
     except Exception as e:
         st.error(f"Error loading CSV file: {str(e)}")
         return None
 
-# Helper to read last N lines from a log file
-def read_last_n_lines(filename, n=200):
+@st.cache_resource(show_spinner=False)
+def get_sku_mapper(file_bytes):
+    """Build a SKUMapper from mapping file contents, reused across reruns for the same file."""
+    return SKUMapper(io.BytesIO(file_bytes))
+
+def dataframe_to_csv_bytes(df):
+    """Serialize a DataFrame to CSV bytes using Arrow's C++ writer."""
+    buffer = io.BytesIO()
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buffer)
+    return buffer.getvalue()
+
+# Helper to read last N lines from a log file, reading backwards so only the tail is loaded
+def read_last_n_lines(filename, n=200, block_size=8192):
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return ''.join(f.readlines()[-n:])
+        with open(filename, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            data = b''
+            while position > 0 and data.count(b'\n') <= n:
+                step = min(block_size, position)
+                position -= step
+                f.seek(position)
+                data = f.read(step) + data
+        return b''.join(data.splitlines(keepends=True)[-n:]).decode('utf-8', errors='replace')
     except Exception:
         return 'No logs available.'
 
-def push_to_baserow(df):
-    """Push processed data to Baserow table."""
-    if not BASEROW_TOKEN:
+def sku_filter(sku):
+    """Return the Baserow filter matching rows whose SKU equals the given one."""
+    return {"type": "equal", "field": BASEROW_SKU_FIELD_ID, "value": sku}
+
+def iter_sku_filter_batches(skus):
+    """Split SKUs into batches whose encoded filters fit within BASEROW_FILTER_MAX_QUERY_LENGTH."""
+    batch = []
+    query_length = 0
+    for sku in skus:
+        # Each filter is URL-encoded the way requests encodes params, plus its separating comma
+        filter_length = len(quote_plus(json.dumps(sku_filter(sku), separators=(',', ':')))) + len('%2C')
+        if batch and (query_length + filter_length > BASEROW_FILTER_MAX_QUERY_LENGTH
+                      or len(batch) == BASEROW_FILTER_BATCH_SIZE):
+            yield batch
+            batch = []
+            query_length = 0
+        batch.append(sku)
+        query_length += filter_length
+    if batch:
+        yield batch
+
+def iter_existing_skus(skus):
+    """Yield the SKUs from the given list that already have a row in the Baserow table."""
+    # Let Baserow match the SKUs server-side instead of listing the whole table
+    sku_filters = json.dumps({
+        "filter_type": "OR",
+        "filters": [sku_filter(sku) for sku in skus]
+    }, separators=(',', ':'))
+    page = 1
+    while True:
+        response = SESSION.get(
+            f"{BASEROW_URL}/api/database/rows/table/{TABLE_ID}/",
+            # Only the SKU field is needed, so don't transfer the other columns
+            params={
+                "size": BASEROW_PAGE_SIZE,
+                "page": page,
+                "include": BASEROW_FIELD_MAP['SKU'],
+                "filters": sku_filters
+            },
+            timeout=BASEROW_TIMEOUT
+        )
+        response.raise_for_status()
+        data = response.json()
+        for record in data.get('results', []):
+            yield record[BASEROW_FIELD_MAP['SKU']]
+        if not data.get('next'):
+            break
+        page += 1
+
+def get_existing_skus(skus):
+    """Return the subset of the given SKUs already in the Baserow table as a frozenset."""
+    skus = list(dict.fromkeys(skus))
+    batches = list(iter_sku_filter_batches(skus))
+    existing_skus = set()
+    with ThreadPoolExecutor(max_workers=BASEROW_MAX_WORKERS) as executor:
+        for batch_skus in executor.map(lambda batch: list(iter_existing_skus(batch)), batches):
+            existing_skus.update(batch_skus)
+    return frozenset(existing_skus)
+
+def post_retry_delay(response, attempt):
+    """Return the seconds to wait before resending a rejected batch, honouring Retry-After."""
+    retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        try:
+            return Retry().parse_retry_after(retry_after)
+        except InvalidHeader:
+            pass
+    return BASEROW_BACKOFF_FACTOR * (2 ** attempt)
+
+def post_batch_to_baserow(batch):
+    """Create a batch of rows in Baserow and return how many were created."""
+    # orjson encodes the payload much faster than the stdlib and accepts stray NumPy scalars;
+    # the session already sends Content-Type: application/json
+    payload = orjson.dumps({"items": batch}, option=orjson.OPT_SERIALIZE_NUMPY)
+    for attempt in range(BASEROW_RETRIES + 1):
+        response = SESSION.post(
+            f"{BASEROW_URL}/api/database/rows/table/{TABLE_ID}/batch/",
+            data=payload,
+            timeout=BASEROW_TIMEOUT
+        )
+        # Resend only when Baserow rejected the batch without storing it
+        if response.status_code not in BASEROW_POST_RETRY_STATUSES or attempt == BASEROW_RETRIES:
+            break
+        time.sleep(post_retry_delay(response, attempt))
+    if not response.ok:
+        logger.error(f"Error response from Baserow: {response.text}")
+    response.raise_for_status()
+    return len(response.json().get('items', []))
+
+def push_to_baserow(df, on_progress=None):
+    """Push processed data to Baserow table.
+    
+    on_progress, if given, is called as on_progress(batches_done, total_batches) after each batch.
+    """
+    if not get_baserow_config().token:
         st.error("Missing Baserow API token. Please check your .env file.")
         return {"success": 0, "skipped": 0, "error": 1}
     
-    headers = {
-        'Authorization': f'Token {BASEROW_TOKEN}',
-        'Content-Type': 'application/json'
-    }
+    # Nothing to push when every row was skipped; the frame then has no columns either
+    if df.empty:
+        return {"success": 0, "skipped": 0, "error": 0}
+    
+    # Drop repeated SKUs within the upload itself so only one row per SKU reaches the API
+    deduped_df = df.drop_duplicates(subset=['SKU'], keep='first')
+    skipped_in_file = len(df) - len(deduped_df)
+    if skipped_in_file:
+        logger.info("Dropping %d rows with SKUs repeated in the upload", skipped_in_file)
+    df = deduped_df
     
     # First, get existing records to check for duplicates
+    skus = df['SKU'].map(str)
     try:
-        response = requests.get(
-            f"{BASEROW_URL}/api/database/rows/table/{TABLE_ID}/",
-            headers=headers
-        )
-        response.raise_for_status()
-        existing_records = response.json()
         # Check for duplicates based on SKU
-        existing_skus = {record['field_4647812'] for record in existing_records.get('results', [])}
+        existing_skus = get_existing_skus(skus)
     except Exception as e:
         logger.error(f"Error fetching existing records: {str(e)}")
         st.error("Failed to fetch existing records from Baserow")
@@ -101,64 +289,80 @@ def push_to_baserow(df):
     
     success_count = 0
     error_count = 0
-    skipped_duplicates = 0
-    skipped_empty = 0
-    total_rows = len(df)
     
-    for idx, row in df.iterrows():
-        # Skip if this SKU already exists
-        if row['SKU'] in existing_skus:
-            logger.info(f"Skipping duplicate SKU: {row['SKU']}")
-            skipped_duplicates += 1
-            continue
-        # Skip if quantity is NaN or 0
-        if pd.isna(row['Quantity']) or row['Quantity'] == 0:
-            logger.info(f"Skipping empty/NaN quantity for SKU: {row['SKU']}")
-            skipped_empty += 1
-            continue
-        try:
-            # Convert date to YYYY-MM-DD format
-            try:
-                date_value = pd.to_datetime(row['Date']).strftime('%Y-%m-%d')
-            except:
-                date_value = datetime.now().strftime('%Y-%m-%d')
-            # Convert quantity and stock to integers, with fallbacks
-            try:
-                quantity = int(float(row['Quantity']))
-            except:
-                quantity = 0
+    # Skip SKUs that already exist in Baserow
+    duplicate_mask = df['SKU'].isin(existing_skus)
+    skipped_duplicates = int(duplicate_mask.sum())
+    logger.info("Skipping %d duplicate SKUs already in Baserow", skipped_duplicates)
+    if logger.isEnabledFor(logging.DEBUG):
+        for sku in df.loc[duplicate_mask, 'SKU']:
+            logger.debug("Skipping duplicate SKU: %s", sku)
+    df = df[~duplicate_mask]
+    
+    # Coerce numeric columns once; unparseable values become NaN
+    quantity = pd.to_numeric(df['Quantity'], errors='coerce')
+    stock_left = pd.to_numeric(df['StockLeft'], errors='coerce')
+    
+    # Skip rows where quantity is NaN or 0
+    empty_mask = quantity.isna() | (quantity == 0)
+    skipped_empty = int(empty_mask.sum())
+    logger.info("Skipping %d rows with empty/NaN quantity", skipped_empty)
+    if logger.isEnabledFor(logging.DEBUG):
+        for sku in df.loc[empty_mask, 'SKU']:
+            logger.debug("Skipping empty/NaN quantity for SKU: %s", sku)
+    df = df[~empty_mask]
+    quantity = quantity[~empty_mask]
+    stock_left = stock_left[~empty_mask]
+    
+    # Prepare the data for Baserow, then rename to the table's field IDs
+    today = datetime.now().strftime('%Y-%m-%d')
+    upload_df = pd.DataFrame({
+        # Date in YYYY-MM-DD format (process_sales_data already emits ISO dates)
+        'Date': pd.to_datetime(df['Date'], errors='coerce', format='%Y-%m-%d').dt.strftime('%Y-%m-%d').fillna(today),
+        # Source, Sku, Msku (truncate if too long)
+        'Source': df['Source'].map(str).str[:255],
+        'SKU': df['SKU'].map(str).str[:255],
+        'MSKU': df['MSKU'].map(str).str[:255],
+        # Quantity as integer
+        'Quantity': quantity.astype('int64'),
+        # OrderID (truncate if too long)
+        'OrderID': df['OrderID'].map(str).str[:255],
+        # StockLeft as positive integer
+        'StockLeft': stock_left.fillna(0).clip(lower=0).astype('int64')
+    }, index=df.index).rename(columns=BASEROW_FIELD_MAP)
+    payloads = upload_df.to_dict(orient='records')
+    # Log the data being sent
+    if logger.isEnabledFor(logging.DEBUG):
+        for idx, data in zip(upload_df.index, payloads):
+            logger.debug("Sending data for row %s: %s", idx, data)
+    
+    # Push to Baserow in batches using the batch-create endpoint, several batches in flight at once
+    rows_iter = iter(payloads)
+    batches = []
+    while True:
+        batch = list(islice(rows_iter, BASEROW_BATCH_SIZE))
+        if not batch:
+            break
+        batches.append(batch)
+    with ThreadPoolExecutor(max_workers=BASEROW_MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(post_batch_to_baserow, batch): (batch_number, len(batch))
+            for batch_number, batch in enumerate(batches, start=1)
+        }
+        for batches_done, future in enumerate(as_completed(futures), start=1):
+            batch_number, batch_size = futures[future]
             try:
-                stock_left = max(0, int(float(row['StockLeft'])))
-            except:
-                stock_left = 0
-            # Prepare the data for Baserow with the correct field IDs
-            data = {
-                'field_4647810': date_value,  # Date in YYYY-MM-DD format
-                'field_4647811': str(row['Source'])[:255],  # Source (truncate if too long)
-                'field_4647812': str(row['SKU'])[:255],  # Sku (truncate if too long)
-                'field_4647904': str(row['MSKU'])[:255],  # Msku (truncate if too long)
-                'field_4647908': quantity,  # Quantity as integer
-                'field_4647912': str(row['OrderID'])[:255],  # OrderID (truncate if too long)
-                'field_4647913': stock_left  # StockLeft as positive integer
-            }
-            # Log the data being sent
-            logger.info(f"Sending data for row {idx}: {data}")
-            # Push to Baserow
-            response = requests.post(
-                f"{BASEROW_URL}/api/database/rows/table/{TABLE_ID}/",
-                headers=headers,
-                json=data
-            )
-            if response.status_code != 200 and response.status_code != 201:
-                logger.error(f"Error response from Baserow: {response.text}")
-                raise Exception(f"Baserow API returned status code {response.status_code}")
-            response.raise_for_status()
-            success_count += 1
-        except Exception as e:
-            logger.error(f"Error pushing row {idx} to Baserow: {str(e)}")
-            error_count += 1
-            continue
-    return {"success": success_count, "skipped": skipped_duplicates + skipped_empty, "error": error_count}
+                created = future.result()
+                success_count += created
+                error_count += batch_size - created
+                logger.info("Batch %d: %d rows created, %d failed", batch_number, created, batch_size - created)
+            except requests.RequestException as e:
+                # Retries are exhausted; Baserow batch requests are atomic, so the whole batch failed
+                logger.error(f"Error pushing batch {batch_number} ({batch_size} rows) to Baserow: {str(e)}")
+                error_count += batch_size
+            if on_progress:
+                on_progress(batches_done, len(batches))
+    return {"success": success_count, "skipped": skipped_in_file + skipped_duplicates + skipped_empty, "error": error_count}
 
 def main():
     # Set page config
@@ -230,11 +434,11 @@ def main():
             help="Upload the Excel file containing SKU mappings"
         )
         if excel_file:
-            excel_data = load_excel_data(excel_file)
+            excel_data = load_excel_data(excel_file.getvalue())
             if excel_data is not None:
                 st.markdown('<div class="success-box">Excel file loaded successfully!</div>', unsafe_allow_html=True)
                 with st.expander("View Excel Data Preview"):
-                    st.dataframe(excel_data.head(), use_container_width=True)
+                    st.dataframe(excel_data, use_container_width=True)
 
     with col2:
         st.subheader("📈 Upload Sales Data")
@@ -244,57 +448,109 @@ def main():
             help="Upload the CSV file containing sales data"
         )
         if csv_file:
-            csv_data = load_csv_data(csv_file)
+            csv_data = load_csv_data(csv_file.getvalue())
             if csv_data is not None:
                 st.markdown('<div class="success-box">CSV file loaded successfully!</div>', unsafe_allow_html=True)
                 with st.expander("View CSV Data Preview"):
-                    st.dataframe(csv_data.head(), use_container_width=True)
+                    st.dataframe(csv_data.head(PREVIEW_ROWS), use_container_width=True)
 
     # Process button with custom styling
     st.markdown("---")
+    save_local_copy = st.checkbox(
+        "💾 Save a copy to the LocalOutput folder",
+        value=True,
+        help="Keep a server-side copy of the processed CSV in addition to the download"
+    )
     if st.button("🔄 Process Data", use_container_width=True):
         if excel_file and csv_file:
             try:
-                with st.spinner("Processing data..."):
-                    # Initialize SKUMapper with Excel data
-                    sku_mapper = SKUMapper(excel_file)
-                    # Fetch latest stock from Baserow
-                    baserow_stock = fetch_baserow_stock_levels(BASEROW_TOKEN, TABLE_ID, BASEROW_URL)
-                    sku_mapper.set_stock_levels(baserow_stock)
-                    # Process CSV data
-                    processed_df = process_sales_data(csv_data, sku_mapper, csv_file.name)
-                    
-                    # Display processed data
-                    st.subheader("📊 Processed Data Preview")
-                    st.dataframe(processed_df.head(), use_container_width=True)
-                    
-                    # Save processed data to LocalOutput folder
+                # Identify these inputs so an unchanged re-run can reuse the last result. The sales
+                # file name is part of the key because it ends up in the Source column
+                input_hash = hashlib.blake2b(digest_size=16)
+                for part in (excel_file.getvalue(), csv_file.getvalue(), csv_file.name.encode('utf-8')):
+                    # Prefix each part with its length so different splits can't hash the same
+                    input_hash.update(len(part).to_bytes(8, 'big'))
+                    input_hash.update(part)
+                input_key = input_hash.hexdigest()
+                last_run = st.session_state.get("last_run")
+                reuse_last_run = last_run is not None and last_run["key"] == input_key
+                
+                if reuse_last_run:
+                    processed_df = last_run["processed_df"]
+                    csv_bytes = last_run["csv_bytes"]
+                    output_filename = last_run["output_filename"]
+                    st.info("Input files are unchanged since the last successful run. Showing the previous results.")
+                else:
+                    with st.spinner("Processing data..."):
+                        # Get SKUMapper for the Excel data, with its own copy of the stock levels
+                        sku_mapper = get_sku_mapper(excel_file.getvalue()).copy()
+                        # Fetch latest stock from Baserow
+                        baserow_stock = fetch_baserow_stock_levels(
+                            get_baserow_config().token, TABLE_ID, BASEROW_URL,
+                            session=SESSION, timeout=BASEROW_TIMEOUT
+                        )
+                        sku_mapper.set_stock_levels(baserow_stock)
+                        # Process CSV data
+                        processed_df = process_sales_data(csv_data, sku_mapper, csv_file.name)
+                        
+                        # Serialize processed data once into an in-memory buffer
+                        csv_bytes = dataframe_to_csv_bytes(processed_df)
+                        
+                        output_filename = f"processed_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+                
+                # Save processed data to LocalOutput folder, also when reusing the last result
+                # since the checkbox may have been ticked only after that run
+                if save_local_copy:
                     output_dir = "LocalOutput"
                     os.makedirs(output_dir, exist_ok=True)
-                    output_filename = os.path.join(output_dir, f"processed_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-                    processed_df.to_csv(output_filename, index=False)
-                    
-                    # Provide download link
-                    with open(output_filename, 'rb') as f:
-                        st.download_button(
-                            label="⬇️ Download Processed Data",
-                            data=f,
-                            file_name=os.path.basename(output_filename),
-                            mime='text/csv',
-                            use_container_width=True
+                    with open(os.path.join(output_dir, output_filename), 'wb') as f:
+                        f.write(csv_bytes)
+                
+                # Display processed data
+                st.subheader("📊 Processed Data Preview")
+                st.dataframe(processed_df.head(PREVIEW_ROWS), use_container_width=True)
+                
+                # Provide download link
+                st.download_button(
+                    label="⬇️ Download Processed Data",
+                    data=csv_bytes,
+                    file_name=output_filename,
+                    mime='text/csv',
+                    use_container_width=True
+                )
+                
+                # Push to Baserow
+                st.markdown("---")
+                st.subheader("🔄 Pushing to Baserow")
+                if reuse_last_run:
+                    push_result = last_run["push_result"]
+                else:
+                    # The batches are sent from worker threads; report each one as it completes
+                    push_progress = st.progress(0.0, text="Pushing data to Baserow...")
+                    push_result = push_to_baserow(
+                        processed_df,
+                        on_progress=lambda done, total: push_progress.progress(
+                            done / total, text=f"Pushed {done} of {total} batches to Baserow"
                         )
-                    
-                    # Push to Baserow
-                    st.markdown("---")
-                    st.subheader("🔄 Pushing to Baserow")
-                    with st.spinner("Pushing data to Baserow..."):
-                        push_result = push_to_baserow(processed_df)
-                        if push_result["success"] > 0:
-                            st.markdown('<div class="success-box">Data successfully pushed to Baserow!</div>', unsafe_allow_html=True)
-                        elif push_result["skipped"] == len(processed_df):
-                            st.markdown('<div class="warning-box">All rows were skipped due to duplicates or empty columns. No new data was pushed.</div>', unsafe_allow_html=True)
-                        elif push_result["error"] > 0:
-                            st.markdown('<div class="error-box">Failed to push data to Baserow. Check the logs for details.</div>', unsafe_allow_html=True)
+                    )
+                    push_progress.empty()
+                    # Only remember fully successful runs, so a failed push can be retried
+                    if push_result["error"] == 0:
+                        st.session_state["last_run"] = {
+                            "key": input_key,
+                            "processed_df": processed_df,
+                            "csv_bytes": csv_bytes,
+                            "output_filename": output_filename,
+                            "push_result": push_result
+                        }
+                    else:
+                        st.session_state.pop("last_run", None)
+                if push_result["success"] > 0:
+                    st.markdown('<div class="success-box">Data successfully pushed to Baserow!</div>', unsafe_allow_html=True)
+                elif push_result["skipped"] == len(processed_df):
+                    st.markdown('<div class="warning-box">All rows were skipped due to duplicates or empty columns. No new data was pushed.</div>', unsafe_allow_html=True)
+                elif push_result["error"] > 0:
+                    st.markdown('<div class="error-box">Failed to push data to Baserow. Check the logs for details.</div>', unsafe_allow_html=True)
                 
             except Exception as e:
                 st.markdown(f'<div class="error-box">Error processing data: {str(e)}</div>', unsafe_allow_html=True)
@@ -306,6 +562,9 @@ def main():
     
     # Log Window Dropdown
     with st.expander("📋 View Processing Logs", expanded=False):
+        # Write out any buffered log records before reading the file
+        for handler in logging.getLogger().handlers:
+            handler.flush()
         log_text = read_last_n_lines('warehouse_management.log', n=200)
         st.text_area(
             "Processing Logs",
@@ -1,56 +1,108 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+from pyarrow import csv as pacsv
 import logging
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union, BinaryIO, Iterator, Iterable
 from pathlib import Path
 from datetime import datetime
 import os
+import copy
+import re
+import functools
 import requests
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('warehouse_management.log'),
-        logging.StreamHandler()
-    ]
-)
+# Logging is configured by the entry point (app.py or main() below)
 logger = logging.getLogger(__name__)
 
-def fetch_baserow_stock_levels(api_token: str, table_id: str, baserow_url: str = "https://api.baserow.io") -> dict:
-    """Fetch all current stock values from Baserow for every SKU/MSKU."""
+# Rust-based calamine parser; much faster than openpyxl for the mapping workbook
+EXCEL_ENGINE = "calamine"
+
+# Baserow field IDs for each processed-data column
+BASEROW_FIELD_MAP = {
+    'Date': 'field_4647810',
+    'Source': 'field_4647811',
+    'SKU': 'field_4647812',
+    'MSKU': 'field_4647904',
+    'Quantity': 'field_4647908',
+    'OrderID': 'field_4647912',
+    'StockLeft': 'field_4647913',
+}
+
+# Baserow returns at most 200 rows per list page; without a size it returns only 100
+BASEROW_PAGE_SIZE = 200
+
+# Seconds to wait on a Baserow connection or response before giving up
+BASEROW_TIMEOUT = 30
+
+def fetch_baserow_stock_levels(api_token: str, table_id: str, baserow_url: str = "https://api.baserow.io",
+                               session: Optional[requests.Session] = None,
+                               timeout: float = BASEROW_TIMEOUT) -> dict:
+    """
+    Fetch all current stock values from Baserow for every SKU/MSKU.
+    
+    Pass a session to reuse its pooled connections and retry policy; otherwise a
+    short-lived session is opened for this call. timeout bounds each page request,
+    so a stalled page fails (or is retried by the session) instead of hanging.
+    """
     headers = {
         'Authorization': f'Token {api_token}',
         'Content-Type': 'application/json'
     }
+    owns_session = session is None
+    if owns_session:
+        session = requests.Session()
     stock_map = {}
     try:
-        response = requests.get(
-            f"{baserow_url}/api/database/rows/table/{table_id}/",
-            headers=headers
-        )
-        response.raise_for_status()
-        records = response.json().get('results', [])
-        for record in records:
-            sku = str(record.get('field_4647812', '')).strip()
-            msku = str(record.get('field_4647904', '')).strip()
-            stock = int(record.get('field_4647913', 0))
-            if msku:
-                stock_map[msku] = stock
-            elif sku:
-                stock_map[sku] = stock
+        # Page through the whole table on one keep-alive connection, fetching only the fields used here
+        page = 1
+        while True:
+            response = session.get(
+                f"{baserow_url}/api/database/rows/table/{table_id}/",
+                headers=headers,
+                params={
+                    "size": BASEROW_PAGE_SIZE,
+                    "page": page,
+                    "include": ",".join(BASEROW_FIELD_MAP[name] for name in ('SKU', 'MSKU', 'StockLeft'))
+                },
+                timeout=timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+            for record in data.get('results', []):
+                sku = str(record.get(BASEROW_FIELD_MAP['SKU'], '')).strip()
+                msku = str(record.get(BASEROW_FIELD_MAP['MSKU'], '')).strip()
+                stock = int(record.get(BASEROW_FIELD_MAP['StockLeft'], 0))
+                if msku:
+                    stock_map[msku] = stock
+                elif sku:
+                    stock_map[sku] = stock
+            if not data.get('next'):
+                break
+            page += 1
     except Exception as e:
         logger.error(f"Error fetching stock levels from Baserow: {str(e)}")
+        # Don't hand back a partial table when a later page fails
+        return {}
+    finally:
+        if owns_session:
+            session.close()
     return stock_map
 
+def _clean_string_columns(df: pd.DataFrame, *columns: str) -> List[List[str]]:
+    """Drop rows missing any of the given columns and return each column as stripped strings."""
+    df = df.dropna(subset=list(columns))
+    # Arrow-backed strings convert like str() but strip in C++ rather than per Python object
+    return [df[col].astype('string[pyarrow]').str.strip().tolist() for col in columns]
+
 class SKUMapper:
-    def __init__(self, excel_path: str):
+    def __init__(self, excel_path: Union[str, BinaryIO]):
         """
         Initialize SKUMapper with data from Excel file.
         
         Args:
-            excel_path (str): Path to the Excel file containing mapping data
+            excel_path (str | BinaryIO): Path to the Excel file containing mapping data,
+                or an in-memory file-like object (e.g. io.BytesIO of an upload)
         """
         self.excel_path = excel_path
         self.chronology_df = None
@@ -73,36 +125,47 @@ class SKUMapper:
     def _load_excel_data(self) -> None:
         """Load all required sheets from the Excel file."""
         try:
-            # Load Chronology sheet and clean it
-            self.chronology_df = pd.read_excel(self.excel_path, sheet_name="Chronology")
-            # Find the row with column headers (sku, msku)
-            header_row = self.chronology_df[self.chronology_df['Unnamed: 7'] == 'sku'].index[0]
-            self.chronology_df = self.chronology_df.iloc[header_row+1:].reset_index(drop=True)
-            self.chronology_df = self.chronology_df[['Unnamed: 7', 'Unnamed: 8']].rename(
-                columns={'Unnamed: 7': 'SKU', 'Unnamed: 8': 'MSKU'}
-            )
-            
-            # Load Current Inventory sheet
-            self.current_inventory_df = pd.read_excel(self.excel_path, sheet_name="Current Inventory ", header=1)
-            if 'msku' not in self.current_inventory_df.columns or 'Opening Stock' not in self.current_inventory_df.columns:
-                raise ValueError("Required columns not found in Current Inventory sheet")
-            
-            # Load Combos skus sheet
-            self.combos_df = pd.read_excel(self.excel_path, sheet_name="Combos skus")
-            # The structure is different - Combo column contains the combo MSKU and SKU1-SKU14 contain the base SKUs
-            self.combos_df = self.combos_df[['Combo ', 'SKU1']].rename(columns={
-                'Combo ': 'Combo_MSKU',
-                'SKU1': 'Base_SKU'
-            })
-            
-            # Load Msku With Skus sheet
-            self.msku_with_skus_df = pd.read_excel(self.excel_path, sheet_name="Msku With Skus")
-            # The structure is different - columns are already named correctly
-            self.msku_with_skus_df = self.msku_with_skus_df[['sku', 'msku']].rename(columns={
-                'sku': 'SKU',
-                'msku': 'MSKU'
-            })
-            
+            # Open the workbook once and parse every sheet from the same handle,
+            # keeping only the columns the mappings use
+            with pd.ExcelFile(self.excel_path, engine=EXCEL_ENGINE) as workbook:
+                # Load Chronology sheet and clean it
+                self.chronology_df = workbook.parse(
+                    sheet_name="Chronology", usecols=lambda col: col in ('Unnamed: 7', 'Unnamed: 8')
+                )
+                # Find the row with column headers (sku, msku)
+                header_row = self.chronology_df[self.chronology_df['Unnamed: 7'] == 'sku'].index[0]
+                self.chronology_df = self.chronology_df.iloc[header_row+1:].reset_index(drop=True)
+                self.chronology_df = self.chronology_df[['Unnamed: 7', 'Unnamed: 8']].rename(
+                    columns={'Unnamed: 7': 'SKU', 'Unnamed: 8': 'MSKU'}
+                )
+                
+                # Load Current Inventory sheet
+                self.current_inventory_df = workbook.parse(
+                    sheet_name="Current Inventory ", header=1, usecols=lambda col: col in ('msku', 'Opening Stock')
+                )
+                if 'msku' not in self.current_inventory_df.columns or 'Opening Stock' not in self.current_inventory_df.columns:
+                    raise ValueError("Required columns not found in Current Inventory sheet")
+                
+                # Load Combos skus sheet
+                self.combos_df = workbook.parse(
+                    sheet_name="Combos skus", usecols=lambda col: col in ('Combo ', 'SKU1')
+                )
+                # The structure is different - Combo column contains the combo MSKU and SKU1-SKU14 contain the base SKUs
+                self.combos_df = self.combos_df[['Combo ', 'SKU1']].rename(columns={
+                    'Combo ': 'Combo_MSKU',
+                    'SKU1': 'Base_SKU'
+                })
+                
+                # Load Msku With Skus sheet
+                self.msku_with_skus_df = workbook.parse(
+                    sheet_name="Msku With Skus", usecols=lambda col: col in ('sku', 'msku')
+                )
+                # The structure is different - columns are already named correctly
+                self.msku_with_skus_df = self.msku_with_skus_df[['sku', 'msku']].rename(columns={
+                    'sku': 'SKU',
+                    'msku': 'MSKU'
+                })
+                
             logger.info("Successfully loaded all Excel sheets")
         except Exception as e:
             logger.error(f"Error loading Excel data: {str(e)}")
@@ -121,47 +184,34 @@ class SKUMapper:
     
     def _build_sku_msku_mappings(self) -> None:
         """Build bidirectional mappings between SKUs and MSKUs."""
-        # Add mappings from Chronology sheet
-        if not self.chronology_df.empty:
-            for _, row in self.chronology_df.iterrows():
-                if pd.notna(row['SKU']) and pd.notna(row['MSKU']):
-                    sku = str(row['SKU']).strip()
-                    msku = str(row['MSKU']).strip()
-                    self.sku_to_msku_map[sku] = msku
-                    self.msku_to_sku_map[msku] = sku
-        
-        # Add mappings from Msku With Skus sheet
-        if not self.msku_with_skus_df.empty:
-            for _, row in self.msku_with_skus_df.iterrows():
-                if pd.notna(row['SKU']) and pd.notna(row['MSKU']):
-                    sku = str(row['SKU']).strip()
-                    msku = str(row['MSKU']).strip()
-                    self.sku_to_msku_map[sku] = msku
-                    self.msku_to_sku_map[msku] = sku
+        # Stack the Chronology sheet above Msku With Skus and clean both in one pass;
+        # later rows overwrite earlier ones, so Msku With Skus still takes precedence
+        mapping_df = pd.concat([self.chronology_df, self.msku_with_skus_df], ignore_index=True)
+        skus, mskus = _clean_string_columns(mapping_df, 'SKU', 'MSKU')
+        self.sku_to_msku_map.update(zip(skus, mskus))
+        self.msku_to_sku_map.update(zip(mskus, skus))
+        # Index-backed copy of the SKU mapping for whole-column lookups
+        self.sku_to_msku_series = pd.Series(self.sku_to_msku_map, dtype=object)
         
         logger.info(f"Built SKU/MSKU mappings with {len(self.sku_to_msku_map)} entries")
     
     def _build_combo_expansion_mapping(self) -> None:
         """Build mapping for expanding combo MSKUs into individual SKUs."""
         if not self.combos_df.empty:
-            for _, row in self.combos_df.iterrows():
-                if pd.notna(row['Combo_MSKU']) and pd.notna(row['Base_SKU']):
-                    combo_msku = str(row['Combo_MSKU']).strip()
-                    base_sku = str(row['Base_SKU']).strip()
-                    if combo_msku not in self.combo_expansion_map:
-                        self.combo_expansion_map[combo_msku] = []
-                    self.combo_expansion_map[combo_msku].append(base_sku)
+            combo_mskus, base_skus = _clean_string_columns(self.combos_df, 'Combo_MSKU', 'Base_SKU')
+            # Group base SKUs under their combo, keeping sheet order
+            combos = pd.Series(base_skus, index=combo_mskus, dtype=object)
+            self.combo_expansion_map.update(combos.groupby(level=0, sort=False).agg(list).to_dict())
         
         logger.info(f"Built combo expansion mapping with {len(self.combo_expansion_map)} entries")
     
     def _build_stock_levels(self) -> None:
         """Build current stock levels from Current Inventory sheet."""
         if not self.current_inventory_df.empty:
-            for _, row in self.current_inventory_df.iterrows():
-                if pd.notna(row['msku']) and pd.notna(row['Opening Stock']):
-                    msku = str(row['msku']).strip()
-                    stock = int(row['Opening Stock'])
-                    self.stock_levels[msku] = stock
+            inventory = self.current_inventory_df.dropna(subset=['msku', 'Opening Stock'])
+            mskus = inventory['msku'].astype('string[pyarrow]').str.strip().tolist()
+            stocks = [int(stock) for stock in inventory['Opening Stock'].tolist()]
+            self.stock_levels.update(zip(mskus, stocks))
         logger.info(f"Built stock levels with {len(self.stock_levels)} entries")
     
     def get_stock_level(self, msku: str) -> int:
@@ -175,10 +225,28 @@ class SKUMapper:
         self.stock_levels[msku] = new_stock
         return new_stock
     
+    def deduct_stock(self, mskus: pd.Series, quantities: pd.Series) -> pd.Series:
+        """
+        Deduct positive quantities from stock in row order and return the stock left after each row.
+        
+        Equivalent to calling update_stock_level row by row: since stock never goes below 0 and
+        only decreases, the level after each row is the opening level minus the running total sold.
+        """
+        sold = quantities.groupby(mskus, sort=False).cumsum()
+        opening = mskus.map(self.stock_levels).fillna(0).astype('int64')
+        stock_left = (opening - sold).clip(lower=0)
+        self.stock_levels.update(stock_left.groupby(mskus, sort=False).last().to_dict())
+        return stock_left
+    
     def get_msku(self, sku: str) -> Optional[str]:
         """Get MSKU for a given SKU."""
         return self.sku_to_msku_map.get(sku.strip(), None)
     
+    def get_mskus(self, skus: pd.Series) -> pd.Series:
+        """Get MSKUs for a Series of already-stripped SKUs in one lookup pass (NaN where unmapped)."""
+        # Look up each distinct SKU once and broadcast the result through the category codes
+        return skus.astype('category').map(self.sku_to_msku_series).astype(object)
+    
     def get_sku(self, msku: str) -> Optional[str]:
         """Get SKU for a given MSKU."""
         return self.msku_to_sku_map.get(msku.strip(), None)
@@ -187,19 +255,34 @@ class SKUMapper:
         """Override stock_levels with values from an external dict (e.g., from Baserow)."""
         self.stock_levels.update(stock_dict)
 
-def load_order_id_patterns() -> List[str]:
-    """Load order ID patterns from configuration file."""
+    def copy(self) -> 'SKUMapper':
+        """Return a copy sharing the mappings but with independent stock levels."""
+        mapper = copy.copy(self)
+        mapper.stock_levels = dict(self.stock_levels)
+        return mapper
+
+def _config_mtime(config_file: str) -> Optional[float]:
+    """Return the modification time of a configuration file, or None if it doesn't exist."""
+    try:
+        return os.path.getmtime(config_file)
+    except OSError:
+        return None
+
+def load_order_id_patterns() -> Tuple[str, ...]:
+    """Load order ID patterns from configuration file, re-reading it only when it changes."""
+    return _load_order_id_patterns("order_id_patterns.txt", _config_mtime("order_id_patterns.txt"))
+
+@functools.lru_cache(maxsize=1)
+def _load_order_id_patterns(config_file: str, mtime: Optional[float]) -> Tuple[str, ...]:
+    """Parse the order ID patterns file; cached per file modification time."""
     patterns = []
-    config_file = "order_id_patterns.txt"
     
     try:
         if os.path.exists(config_file):
-            with open(config_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    # Skip empty lines and comments
-                    if line and not line.startswith('#'):
-                        patterns.append(line.lower())
+            # Read the file in one call and filter its lines in a single comprehension
+            lines = map(str.strip, Path(config_file).read_text(encoding='utf-8').splitlines())
+            # Skip empty lines and comments
+            patterns = [line.lower() for line in lines if line and not line.startswith('#')]
         else:
             logger.warning(f"Configuration file {config_file} not found, using default patterns")
             # Fallback to default patterns
@@ -218,22 +301,25 @@ def load_order_id_patterns() -> List[str]:
         patterns = ['order', 'reference', 'invoice', 'id']
     
     logger.info(f"Loaded {len(patterns)} order ID patterns")
-    return patterns
+    return tuple(patterns)
 
-def analyze_dataframe_columns(df: pd.DataFrame) -> None:
+def analyze_dataframe_columns(df: pd.DataFrame, patterns: Optional[Tuple[str, ...]] = None) -> None:
     """Analyze and log information about DataFrame columns for debugging."""
-    logger.info("=== DataFrame Column Analysis ===")
-    logger.info(f"Total columns: {len(df.columns)}")
-    logger.info(f"Column names: {list(df.columns)}")
-    
-    # Analyze each column
-    for i, col in enumerate(df.columns):
-        col_lower = col.lower()
-        sample_values = df[col].dropna().head(3).tolist()
-        logger.info(f"Column {i+1}: '{col}' (lowercase: '{col_lower}') - Sample values: {sample_values}")
+    # The per-column dump samples every column, so only build it when INFO is actually logged
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("=== DataFrame Column Analysis ===")
+        logger.info(f"Total columns: {len(df.columns)}")
+        logger.info(f"Column names: {list(df.columns)}")
+        
+        # Analyze each column
+        for i, col in enumerate(df.columns):
+            col_lower = col.lower()
+            sample_values = df[col].dropna().head(3).tolist()
+            logger.info(f"Column {i+1}: '{col}' (lowercase: '{col_lower}') - Sample values: {sample_values}")
     
     # Check for potential order ID columns
-    patterns = load_order_id_patterns()
+    if patterns is None:
+        patterns = load_order_id_patterns()
     potential_order_cols = []
     
     for col in df.columns:
@@ -250,11 +336,9 @@ def analyze_dataframe_columns(df: pd.DataFrame) -> None:
     
     logger.info("=== End Column Analysis ===")
 
-def find_order_id_column(df: pd.DataFrame) -> Optional[str]:
-    """Find the column that likely contains order IDs using dynamic patterns."""
-    patterns = load_order_id_patterns()
-    
-    # Split patterns into exact and partial matches
+@functools.lru_cache(maxsize=1)
+def _split_order_id_patterns(patterns: Tuple[str, ...]) -> Tuple[frozenset, Tuple[str, ...], re.Pattern]:
+    """Split order ID patterns into exact and partial matches, plus one regex matching any partial pattern."""
     exact_patterns = []
     partial_patterns = []
     
@@ -264,41 +348,94 @@ def find_order_id_column(df: pd.DataFrame) -> Optional[str]:
             exact_patterns.append(pattern)
         else:
             partial_patterns.append(pattern)
+    partial_regex = re.compile('|'.join(map(re.escape, partial_patterns)))
+    return frozenset(exact_patterns), tuple(partial_patterns), partial_regex
+
+def _match_order_id_column(columns: Iterable[str], patterns: Tuple[str, ...]) -> Tuple[Optional[str], Optional[str], List[str]]:
+    """
+    Match order ID patterns against column names without logging anything.
+    
+    Returns the matched column (or None), the partial pattern it matched (None for an
+    exact match), and the date-like columns passed over on the way, in the order seen.
+    """
+    exact_patterns, partial_patterns, partial_regex = _split_order_id_patterns(patterns)
+    columns = list(columns)
     
     # First, try exact matches (highest priority)
-    for col in df.columns:
-        col_lower = col.lower()
-        if col_lower in exact_patterns:
-            logger.info(f"Found exact order ID column match: {col}")
-            return col
+    for col in columns:
+        if col.lower() in exact_patterns:
+            return col, None, []
     
     # Then, try partial matches but avoid date columns
-    for col in df.columns:
+    skipped_date_columns = []
+    for col in columns:
         col_lower = col.lower()
+        # A single regex scan rules out columns that contain none of the patterns
+        if not partial_regex.search(col_lower):
+            continue
         for pattern in partial_patterns:
             if pattern in col_lower:
                 # Skip if this looks like a date column
                 if any(date_word in col_lower for date_word in ['date', 'on', 'time', 'created', 'updated']):
-                    logger.info(f"Skipping date-like column: {col}")
+                    skipped_date_columns.append(col)
                     continue
-                logger.info(f"Found partial order ID column match: {col} (matches pattern: {pattern})")
-                return col
+                return col, pattern, skipped_date_columns
+    return None, None, skipped_date_columns
+
+def find_order_id_column(df: pd.DataFrame) -> Optional[str]:
+    """Find the column that likely contains order IDs using dynamic patterns."""
+    patterns = load_order_id_patterns()
+    col, pattern, skipped_date_columns = _match_order_id_column(df.columns, patterns)
+    for skipped_col in skipped_date_columns:
+        logger.info(f"Skipping date-like column: {skipped_col}")
+    
+    if col is not None:
+        if pattern is None:
+            logger.info(f"Found exact order ID column match: {col}")
+        else:
+            logger.info(f"Found partial order ID column match: {col} (matches pattern: {pattern})")
+        return col
     
     # If no matches found, analyze columns for debugging
-    analyze_dataframe_columns(df)
+    analyze_dataframe_columns(df, patterns)
     return None
 
-def load_date_column_patterns() -> List[str]:
-    """Load date column patterns from configuration file."""
+@functools.lru_cache(maxsize=32)
+def find_sku_column(columns: Tuple[str, ...]) -> Optional[str]:
+    """Find the first column whose name contains 'sku', cached per header so chunks of one file scan it once."""
+    for col in columns:
+        if 'sku' in col.lower():
+            return col
+    return None
+
+def read_sales_csv(source: Union[str, BinaryIO], chunksize: Optional[int] = None):
+    """
+    Read a sales CSV with the C parser, keeping the order ID column as text.
+    
+    Reading order IDs as strings skips dtype inference for them and stops long
+    numeric IDs from being turned into floats when some rows are empty.
+    When chunksize is given, an iterator of DataFrames is returned instead.
+    """
+    header_df = pd.read_csv(source, nrows=0)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    # Match quietly here; process_sales_data detects and reports the column on the data itself
+    order_id_column = _match_order_id_column(header_df.columns, load_order_id_patterns())[0]
+    dtype = {order_id_column: str} if order_id_column else None
+    return pd.read_csv(source, engine='c', dtype=dtype, chunksize=chunksize)
+
+def load_date_column_patterns() -> Tuple[str, ...]:
+    """Load date column patterns from configuration file, re-reading it only when it changes."""
+    return _load_date_column_patterns("date_column_patterns.txt", _config_mtime("date_column_patterns.txt"))
+
+@functools.lru_cache(maxsize=1)
+def _load_date_column_patterns(config_file: str, mtime: Optional[float]) -> Tuple[str, ...]:
+    """Parse the date column patterns file; cached per file modification time."""
     patterns = []
-    config_file = "date_column_patterns.txt"
     try:
         if os.path.exists(config_file):
-            with open(config_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        patterns.append(line.lower())
+            lines = map(str.strip, Path(config_file).read_text(encoding='utf-8').splitlines())
+            patterns = [line.lower() for line in lines if line and not line.startswith('#')]
         else:
             logger.warning(f"Configuration file {config_file} not found, using default patterns")
             patterns = [
@@ -310,12 +447,11 @@ def load_date_column_patterns() -> List[str]:
         logger.error(f"Error loading date column patterns: {str(e)}")
         patterns = ['date', 'date and time', 'datetime', 'timestamp']
     logger.info(f"Loaded {len(patterns)} date column patterns")
-    return patterns
+    return tuple(patterns)
 
-def find_date_column(df: pd.DataFrame) -> Optional[str]:
-    """Find the column that likely contains the main date using dynamic patterns. Extract date from datetime if needed."""
-    patterns = load_date_column_patterns()
-    # Split patterns into exact and partial matches
+@functools.lru_cache(maxsize=1)
+def _split_date_column_patterns(patterns: Tuple[str, ...]) -> Tuple[frozenset, Tuple[str, ...], re.Pattern]:
+    """Split date column patterns into exact and partial matches, plus one regex matching any partial pattern."""
     exact_patterns = []
     partial_patterns = []
     for pattern in patterns:
@@ -323,35 +459,45 @@ def find_date_column(df: pd.DataFrame) -> Optional[str]:
             exact_patterns.append(pattern)
         else:
             partial_patterns.append(pattern)
-    # Helper to check if a column is datetime-like
-    def is_datetime_col(col_name):
-        col_lower = col_name.lower()
-        return (
-            ('date' in col_lower and 'time' in col_lower) or
-            'datetime' in col_lower or
-            'timestamp' in col_lower
-        )
+    partial_regex = re.compile('|'.join(map(re.escape, partial_patterns)))
+    return frozenset(exact_patterns), tuple(partial_patterns), partial_regex
+
+def _is_datetime_column_name(col_lower: str) -> bool:
+    """Check if a lowercased column name looks like a combined date and time column."""
+    return (
+        ('date' in col_lower and 'time' in col_lower) or
+        'datetime' in col_lower or
+        'timestamp' in col_lower
+    )
+
+def find_date_column(df: pd.DataFrame) -> Optional[str]:
+    """Find the column that likely contains the main date using dynamic patterns. Extract date from datetime if needed."""
+    exact_patterns, partial_patterns, partial_regex = _split_date_column_patterns(load_date_column_patterns())
+    # Lowercase every name and flag datetime-like columns once, for all the passes below
+    columns = [(col, col.lower()) for col in df.columns]
+    columns = [(col, col_lower, _is_datetime_column_name(col_lower)) for col, col_lower in columns]
     # First, try exact matches (highest priority), skipping datetime-like columns
-    for col in df.columns:
-        col_lower = col.lower()
-        if col_lower in exact_patterns and not is_datetime_col(col):
+    for col, col_lower, is_datetime_col in columns:
+        if col_lower in exact_patterns and not is_datetime_col:
             logger.info(f"Found exact date column match: {col}")
             return col
     # Then, try partial matches, skipping datetime-like columns
-    for col in df.columns:
-        col_lower = col.lower()
+    for col, col_lower, is_datetime_col in columns:
+        # A single regex scan rules out columns that contain none of the patterns
+        if is_datetime_col or not partial_regex.search(col_lower):
+            continue
         for pattern in partial_patterns:
-            if pattern in col_lower and not is_datetime_col(col):
+            if pattern in col_lower:
                 logger.info(f"Found partial date column match: {col} (matches pattern: {pattern})")
                 return col
     # If no matches found, fallback to any column with 'date' in the name, skipping datetime-like columns
-    for col in df.columns:
-        if 'date' in col.lower() and not is_datetime_col(col):
+    for col, col_lower, is_datetime_col in columns:
+        if 'date' in col_lower and not is_datetime_col:
             logger.info(f"Fallback: Found column with 'date' in name: {col}")
             return col
     # Last resort: look for datetime columns and extract date
-    for col in df.columns:
-        if is_datetime_col(col):
+    for col, col_lower, is_datetime_col in columns:
+        if is_datetime_col:
             logger.info(f"Found datetime column for date extraction: {col}")
             return col
     logger.warning(f"No date or datetime column found. Available columns: {list(df.columns)}")
@@ -388,10 +534,52 @@ def extract_date_from_datetime(date_value) -> str:
         return datetime.now().strftime('%Y-%m-%d')
         
     except Exception as e:
-        logger.warning(f"Error extracting date from {date_value}: {str(e)}")
+        logger.warning("Error extracting date from %s: %s", date_value, e)
+        return datetime.now().strftime('%Y-%m-%d')
+
+# Timezone-free formats tried by extract_date_from_datetime; a string can match at most one of them
+# (and never its offset-aware format), so they can be parsed column-wise without changing precedence
+_PLAIN_DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M:%S', '%Y-%m-%dT%H:%M:%S')
+
+def extract_dates_from_datetimes(values: pd.Series) -> pd.Series:
+    """
+    Extract the date part of a whole Series of datetime values, as YYYY-MM-DD strings.
+    
+    Strings in the common timezone-free formats are parsed in one pandas call per format;
+    everything else (offsets, other layouts, datetime objects, missing values) goes
+    through extract_date_from_datetime one value at a time.
+    """
+    values = values.astype(object)
+    dates = pd.Series(None, index=values.index, dtype=object)
+    pending = values.map(lambda value: isinstance(value, str)).astype(bool)
+    for fmt in _PLAIN_DATETIME_FORMATS:
+        if not pending.any():
+            break
+        parsed = pd.to_datetime(values[pending], format=fmt, errors='coerce').dropna()
+        dates[parsed.index] = parsed.dt.strftime('%Y-%m-%d')
+        pending[parsed.index] = False
+    remaining = dates.isna()
+    dates[remaining] = values[remaining].map(extract_date_from_datetime)
+    return dates
+
+def _parse_date(date_value) -> str:
+    """Format a plain date value as YYYY-MM-DD, falling back to today's date."""
+    try:
+        return pd.to_datetime(date_value).strftime('%Y-%m-%d')
+    except:
         return datetime.now().strftime('%Y-%m-%d')
 
-def process_sales_data(df: pd.DataFrame, sku_mapper: SKUMapper, source_file: str) -> pd.DataFrame:
+def _format_date_column(values: pd.Series, is_datetime_column: bool) -> List[str]:
+    """Format a whole date column as YYYY-MM-DD strings, parsing each distinct value only once."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    if is_datetime_column:
+        formatted = extract_dates_from_datetimes(pd.Series(uniques, dtype=object)).tolist()
+    else:
+        formatted = [_parse_date(value) for value in uniques]
+    return [formatted[code] for code in codes]
+
+def process_sales_data(df: pd.DataFrame, sku_mapper: SKUMapper, source_file: str,
+                       processed_skus: Optional[set] = None) -> pd.DataFrame:
     """
     Process sales data according to the new requirements.
     
@@ -399,22 +587,14 @@ def process_sales_data(df: pd.DataFrame, sku_mapper: SKUMapper, source_file: str
         df: Sales DataFrame
         sku_mapper: Initialized SKUMapper instance
         source_file: Name of the source CSV file
+        processed_skus: SKUs already processed from earlier chunks of the same file;
+            updated in place. A new set is used when not given.
         
     Returns:
         DataFrame with processed data
     """
-    processed_rows = []
-    skipped_rows = 0
-    duplicate_skus = 0
-    empty_rows = 0
-    invalid_quantity_rows = 0
-    
     # Find the SKU/MSKU column
-    sku_column = None
-    for col in df.columns:
-        if 'sku' in col.lower():
-            sku_column = col
-            break
+    sku_column = find_sku_column(tuple(df.columns))
     if not sku_column:
         raise ValueError("No SKU/MSKU column found in the input DataFrame.")
     
@@ -436,99 +616,120 @@ def process_sales_data(df: pd.DataFrame, sku_mapper: SKUMapper, source_file: str
     # Check if the date column is a datetime column
     is_datetime_column = False
     if date_column:
-        col_lower = date_column.lower()
-        is_datetime_column = (
-            ('date' in col_lower and 'time' in col_lower) or
-            'datetime' in col_lower or
-            'timestamp' in col_lower
-        )
+        is_datetime_column = _is_datetime_column_name(date_column.lower())
         if is_datetime_column:
             logger.info(f"Date column '{date_column}' is a datetime column, will extract date part")
     
     # Track processed SKUs to avoid duplicates
-    processed_skus = set()
+    if processed_skus is None:
+        processed_skus = set()
+    
+    # Normalize all identifiers in one pass instead of per row; SKUs repeat across orders,
+    # so going through a categorical converts each distinct value only once
+    identifiers = df[sku_column].astype('category').map(str).str.strip()
     
-    for idx, row in df.iterrows():
+    # Look up every MSKU in bulk rather than once per row
+    if sku_mapper:
+        mapped_mskus = sku_mapper.get_mskus(identifiers).tolist()
+    else:
+        mapped_mskus = [None] * len(df)
+    
+    # Parse quantities as one numeric column, truncating like int(float(value))
+    row_count = len(df)
+    empty_quantities = df['Quantity'].isna().to_numpy()
+    numeric_quantities = pd.to_numeric(df['Quantity'], errors='coerce').astype('float64')
+    parsed_quantities = np.isfinite(numeric_quantities.to_numpy())
+    quantities = [
+        int(value) if parsed else None
+        for value, parsed in zip(np.trunc(numeric_quantities).tolist(), parsed_quantities.tolist())
+    ]
+    # Values pandas can't parse are converted individually; those that still fail are error rows
+    quantity_errors = {}
+    raw_quantities = df['Quantity'].to_numpy()
+    for pos in np.flatnonzero(~empty_quantities & ~parsed_quantities):
         try:
-            # Get basic information
-            identifier = str(row[sku_column]).strip()
-            
-            # Handle NaN values in quantity
-            if pd.isna(row['Quantity']):
-                empty_rows += 1
-                logger.info(f"Skipping row {idx + 1}: Empty quantity found (NaN value)")
-                continue
-                
-            quantity = int(float(row['Quantity']))
-            
-            # Handle date extraction
-            if date_column:
-                if is_datetime_column:
-                    date = extract_date_from_datetime(row[date_column])
-                else:
-                    try:
-                        date = pd.to_datetime(row[date_column]).strftime('%Y-%m-%d')
-                    except:
-                        date = datetime.now().strftime('%Y-%m-%d')
-            else:
-                date = datetime.now().strftime('%Y-%m-%d')
-            
-            # Handle order ID
-            if order_id_column and pd.notna(row[order_id_column]):
-                order_id = str(row[order_id_column]).strip()
-            else:
-                order_id = f"GEN_{idx + 1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            
-            # Check for duplicate SKUs in the same file
-            if identifier in processed_skus:
-                duplicate_skus += 1
-                logger.info(f"Skipping row {idx + 1}: Duplicate SKU '{identifier}' found in data file")
-                continue
-            
-            # Validate quantity
-            if quantity <= 0:
-                invalid_quantity_rows += 1
-                logger.info(f"Skipping row {idx + 1}: Invalid quantity ({quantity}) - must be positive")
-                continue
-            
-            # Get MSKU from mapper
-            if sku_mapper:
-                msku = sku_mapper.get_msku(identifier)
-                if not msku:
-                    logger.warning(f"Row {idx + 1}: No MSKU mapping found for SKU '{identifier}'")
-                    msku = "UNKNOWN"
-            else:
-                msku = "NO_MAPPER"
-            
-            # Update stock level and get new stock left
-            if sku_mapper and msku != "UNKNOWN" and msku != "NO_MAPPER":
-                stock_left = sku_mapper.update_stock_level(msku, quantity)
-            else:
-                stock_left = max(0, quantity)
-            
-            # Create processed row
-            processed_row = {
-                'Date': date,
-                'Source': source_file,
-                'SKU': identifier,
-                'MSKU': msku,
-                'Quantity': quantity,
-                'OrderID': order_id,
-                'StockLeft': stock_left
-            }
-            
-            processed_rows.append(processed_row)
-            processed_skus.add(identifier)
-            
+            quantities[pos] = int(float(raw_quantities[pos]))
         except Exception as e:
-            skipped_rows += 1
-            logger.error(f"Error processing row {idx + 1}: {str(e)}")
-            continue
+            quantity_errors[pos] = e
+    valid_quantities = ~empty_quantities & np.array([quantity is not None for quantity in quantities], dtype=bool)
+    positive_quantities = valid_quantities & np.array(
+        [quantity is not None and quantity > 0 for quantity in quantities], dtype=bool
+    )
+    
+    # A SKU is a duplicate once it was accepted in an earlier chunk or from an earlier row;
+    # only rows with a positive quantity are accepted, so only they claim a SKU
+    claimed_earlier = (
+        pd.Series(positive_quantities, dtype='int64').groupby(identifiers.to_numpy(), sort=False).cumsum().to_numpy()
+        - positive_quantities
+    ) > 0
+    duplicate_rows = valid_quantities & (identifiers.isin(processed_skus).to_numpy() | claimed_earlier)
+    invalid_rows = valid_quantities & ~duplicate_rows & ~positive_quantities
+    accepted_rows = positive_quantities & ~duplicate_rows
+    
+    # Get MSKU from mapper
+    if sku_mapper:
+        unmapped_rows = np.array([not (isinstance(msku, str) and msku) for msku in mapped_mskus], dtype=bool)
+        mskus = ["UNKNOWN" if unmapped else msku for msku, unmapped in zip(mapped_mskus, unmapped_rows)]
+    else:
+        unmapped_rows = np.zeros(row_count, dtype=bool)
+        mskus = ["NO_MAPPER"] * row_count
+    
+    # Report skipped and unmapped rows in file order
+    error_rows = np.zeros(row_count, dtype=bool)
+    error_rows[list(quantity_errors)] = True
+    identifier_values = identifiers.tolist()
+    row_numbers = (df.index + 1).tolist()
+    for pos in np.flatnonzero(
+            empty_quantities | error_rows | duplicate_rows | invalid_rows | (accepted_rows & unmapped_rows)):
+        if empty_quantities[pos]:
+            logger.info("Skipping row %s: Empty quantity found (NaN value)", row_numbers[pos])
+        elif error_rows[pos]:
+            logger.error("Error processing row %s: %s", row_numbers[pos], quantity_errors[pos])
+        elif duplicate_rows[pos]:
+            logger.info("Skipping row %s: Duplicate SKU '%s' found in data file", row_numbers[pos], identifier_values[pos])
+        elif invalid_rows[pos]:
+            logger.info("Skipping row %s: Invalid quantity (%s) - must be positive", row_numbers[pos], quantities[pos])
+        else:
+            logger.warning("Row %s: No MSKU mapping found for SKU '%s'", row_numbers[pos], identifier_values[pos])
+    
+    empty_rows = int(empty_quantities.sum())
+    skipped_rows = len(quantity_errors)
+    duplicate_skus = int(duplicate_rows.sum())
+    invalid_quantity_rows = int(invalid_rows.sum())
+    
+    # Assemble the accepted rows; StockLeft is filled in for all rows at once below
+    accepted = np.flatnonzero(accepted_rows).tolist()
+    if date_column:
+        dates = _format_date_column(df[date_column].iloc[accepted], is_datetime_column)
+    else:
+        dates = [datetime.now().strftime('%Y-%m-%d')] * len(accepted)
+    if order_id_column:
+        # Arrow casts like str() and trims in C++
+        order_id_values = df[order_id_column].iloc[accepted]
+        order_ids = order_id_values.astype('string[pyarrow]').str.strip().tolist()
+        has_order_ids = order_id_values.notna().tolist()
+    else:
+        order_ids = has_order_ids = [None] * len(accepted)
+    # Generated order IDs share one timestamp per call, so rows of a batch stay consistent
+    batch_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    order_ids = [
+        order_id if has_order_id else f"GEN_{row_numbers[pos]}_{batch_timestamp}"
+        for pos, order_id, has_order_id in zip(accepted, order_ids, has_order_ids)
+    ]
+    processed_rows = {
+        'Date': dates,
+        'Source': [source_file] * len(accepted),
+        'SKU': [identifier_values[pos] for pos in accepted],
+        'MSKU': [mskus[pos] for pos in accepted],
+        'Quantity': [quantities[pos] for pos in accepted],
+        'OrderID': order_ids
+    }
+    processed_skus.update(processed_rows['SKU'])
     
     # Log summary statistics
     logger.info(f"=== Processing Summary ===")
     logger.info(f"Total rows in file: {len(df)}")
-    logger.info(f"Successfully processed: {len(processed_rows)} rows")
+    logger.info(f"Successfully processed: {len(accepted)} rows")
     logger.info(f"Skipped empty rows (NaN): {empty_rows} rows")
     logger.info(f"Skipped duplicate SKUs: {duplicate_skus} rows")
     logger.info(f"Skipped invalid quantities: {invalid_quantity_rows} rows")
@@ -541,7 +742,33 @@ def process_sales_data(df: pd.DataFrame, sku_mapper: SKUMapper, source_file: str
     if invalid_quantity_rows > 0:
         logger.info(f"Note: {invalid_quantity_rows} rows with invalid quantities - these were skipped")
     
-    return pd.DataFrame(processed_rows)
+    result_df = pd.DataFrame(processed_rows) if accepted else pd.DataFrame()
+    if not result_df.empty:
+        # Deduct stock for mapped MSKUs; unmapped rows report their own quantity
+        stock_left = result_df['Quantity'].clip(lower=0)
+        if sku_mapper:
+            tracked = ~result_df['MSKU'].isin(["UNKNOWN", "NO_MAPPER"])
+            if tracked.any():
+                stock_left[tracked] = sku_mapper.deduct_stock(
+                    result_df.loc[tracked, 'MSKU'], result_df.loc[tracked, 'Quantity']
+                )
+        result_df['StockLeft'] = stock_left
+        # Source is constant per file while dates and MSKUs repeat across orders; store them as
+        # categories. SKUs stay plain strings since duplicates were dropped and each is unique
+        result_df = result_df.astype({'Date': 'category', 'Source': 'category', 'MSKU': 'category'})
+    return result_df
+
+def iter_processed_sales_chunks(source: Union[str, BinaryIO], sku_mapper: SKUMapper, source_file: str,
+                                chunksize: int = 50_000) -> Iterator[pd.DataFrame]:
+    """
+    Process a sales CSV chunk by chunk so memory stays bounded by the chunk size.
+    
+    Duplicate SKU tracking and stock levels carry over between chunks, so the
+    concatenated output matches a single process_sales_data call on the whole file.
+    """
+    processed_skus = set()
+    for chunk in read_sales_csv(source, chunksize=chunksize):
+        yield process_sales_data(chunk, sku_mapper, source_file, processed_skus)
 
 def main():
     """Main function to process sales data."""
@@ -549,14 +776,26 @@ def main():
         # Initialize SKU mapper
         sku_mapper = SKUMapper("WMS-04-02.xlsx")
         
-        # Load and process sales data
-        sales_df = pd.read_csv("meesho.csv")
-        
-        # Map sales data
-        mapped_df = process_sales_data(sales_df, sku_mapper, "meesho.csv")
-        
-        # Save processed data
-        mapped_df.to_csv("LocalOutput/processed_sales.csv", index=False)
+        # Load, map and save sales data chunk by chunk
+        os.makedirs("LocalOutput", exist_ok=True)
+        with open("LocalOutput/processed_sales.csv", 'wb') as output_file:
+            writer = None
+            try:
+                for mapped_df in iter_processed_sales_chunks("meesho.csv", sku_mapper, "meesho.csv"):
+                    if mapped_df.empty:
+                        continue
+                    table = pa.Table.from_pandas(mapped_df, preserve_index=False)
+                    if writer is None:
+                        # Categories differ between chunks, so write them as plain values under one schema
+                        schema = pa.schema([
+                            pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type) else field
+                            for field in table.schema
+                        ])
+                        writer = pacsv.CSVWriter(output_file, schema)
+                    writer.write_table(table.cast(schema))
+            finally:
+                if writer is not None:
+                    writer.close()
         logging.info("Successfully processed and saved sales data")
         
     except Exception as e:
@@ -564,4 +803,13 @@ def main():
         raise
 
 if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('warehouse_management.log'),
+            logging.StreamHandler()
+        ]
+    )
     main() 
\ No newline at end of file